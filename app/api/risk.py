@@ -1,13 +1,15 @@
-from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from app.api.tiles import get_tile
 from app.models.responses import RiskScoreResponse
-from app.services.risk_engine import RiskEngine
 
 router = APIRouter()
-risk_engine = RiskEngine()
 
 
 @router.get("/score", response_model=RiskScoreResponse)
-async def get_risk_score(
+def get_risk_score(
+    request: Request,
     lat: float = Query(..., description="Latitude"),
     lon: float = Query(..., description="Longitude")
 ):
@@ -19,23 +21,23 @@ async def get_risk_score(
     if not (-180 <= lon <= 180):
         raise HTTPException(status_code=400, detail="Invalid longitude")
     
+    risk_engine = request.app.state.risk_engine
     try:
-        result = await risk_engine.calculate_risk_score(lat, lon)
+        result = risk_engine.calculate_risk_score(lat, lon)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error calculating risk: {str(e)}")
 
 
 @router.get("/heatmap/tiles/{z}/{x}/{y}.pbf")
-async def get_risk_tile(z: int, x: int, y: int):
+async def get_risk_tile(
+    z: int,
+    x: int,
+    y: int,
+    if_none_match: Optional[str] = Header(None)
+):
     """
     Get vector tile for risk heatmap.
     """
-    from app.services.tiler import TileService
-    
-    tile_service = TileService()
-    try:
-        tile_data = await tile_service.get_tile(z, x, y)
-        return tile_data
-    except Exception as e:
-        raise HTTPException(status_code=404, detail=f"Tile not found: {str(e)}")
\ No newline at end of file
+    # Same raw gzip-encoded tile response as the generic tile endpoint
+    return await get_tile(z, x, y, if_none_match)
\ No newline at end of file
@@ -7,7 +7,7 @@ shelter_service = ShelterService()
 
 
 @router.get("/nearby", response_model=NearbySheltersResponse)
-async def get_nearby_shelters(
+def get_nearby_shelters(
     lat: float = Query(..., description="Latitude"),
     lon: float = Query(..., description="Longitude"),
     limit: int = Query(3, description="Number of shelters to return", le=10)
@@ -21,7 +21,7 @@ async def get_nearby_shelters(
         raise HTTPException(status_code=400, detail="Invalid longitude")
     
     try:
-        shelters = await shelter_service.find_nearby_shelters(lat, lon, limit)
+        shelters = shelter_service.find_nearby_shelters(lat, lon, limit)
         return NearbySheltersResponse(
             shelters=shelters,
             lat=lat,
@@ -1,26 +1,45 @@
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
 from fastapi.responses import Response
+from app.services.tiler import tile_service
 
 router = APIRouter()
 
 
 @router.get("/{z}/{x}/{y}.pbf")
-async def get_tile(z: int, x: int, y: int):
+async def get_tile(
+    z: int,
+    x: int,
+    y: int,
+    if_none_match: Optional[str] = Header(None)
+):
     """
     Generic tile endpoint for serving vector tiles.
     """
-    from app.services.tiler import TileService
-    
-    tile_service = TileService()
     try:
         tile_data = await tile_service.get_tile(z, x, y)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Tile not found: {str(e)}")
+    
+    # Headers depend on the read, which also picks up a rebuilt archive
+    cache_headers = tile_service.cache_headers(z, x, y, found=tile_data is not None)
+    if if_none_match == cache_headers["ETag"]:
+        return Response(status_code=304, headers=cache_headers)
+    
+    # No tile at this address: empty response, rendered as a blank tile
+    if tile_data is None:
         return Response(
-            content=tile_data,
-            media_type="application/x-protobuf",
-            headers={
-                "Content-Encoding": "gzip",
-                "Access-Control-Allow-Origin": "*"
-            }
+            status_code=204,
+            headers={"Access-Control-Allow-Origin": "*", **cache_headers}
         )
-    except Exception as e:
-        raise HTTPException(status_code=404, detail=f"Tile not found: {str(e)}")
\ No newline at end of file
+    
+    return Response(
+        content=tile_data,
+        media_type="application/x-protobuf",
+        headers={
+            "Content-Encoding": "gzip",
+            "Access-Control-Allow-Origin": "*",
+            **cache_headers
+        }
+    )
\ No newline at end of file
@@ -7,7 +7,7 @@ from pydantic import ConfigDict
 
 
 class Settings(BaseSettings):
-    model_config = ConfigDict(env_file=".env", case_sensitive=False)
+    model_config = ConfigDict(env_file=".env", case_sensitive=False, frozen=True)
     
     mode: str = "local"
     port: int = 8000
@@ -1,17 +1,34 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 from app.core.config import settings
 from app.models.responses import HealthResponse, ConfigResponse
 from app.api import risk, shelters, tiles
+from app.services.risk_engine import RiskEngine
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load shared, read-only data before serving requests."""
+    risk_engine = RiskEngine()
+    await asyncio.to_thread(risk_engine.load)
+    app.state.risk_engine = risk_engine
+    yield
+
 
 app = FastAPI(
     title=settings.project_name,
     version=settings.version,
-    description="Tokyo Disaster Entrapment Anticipation API"
+    description="Tokyo Disaster Entrapment Anticipation API",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -22,6 +39,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON bodies; responses that already set Content-Encoding (tiles) pass through
+app.add_middleware(GZipMiddleware, minimum_size=256)
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint."""
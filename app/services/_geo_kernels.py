@@ -0,0 +1,41 @@
+import math
+
+import numpy as np
+from numba import njit
+
+EARTH_RADIUS_KM = 6371.0
+
+
+@njit(cache=True, fastmath=True)
+def haversine_km(lat_rad, lon_rad, lats_rad, lons_rad, cos_lats, out):
+    """Write haversine distances (km) from one point to many into ``out``.
+    
+    All coordinates are in radians; ``cos_lats`` is ``cos(lats_rad)``,
+    precomputed by the caller since target points rarely change.
+    """
+    cos_lat = math.cos(lat_rad)
+    for i in range(lats_rad.shape[0]):
+        dlat = lats_rad[i] - lat_rad
+        dlon = lons_rad[i] - lon_rad
+        a = (math.sin(dlat / 2) ** 2 +
+             cos_lat * cos_lats[i] * math.sin(dlon / 2) ** 2)
+        out[i] = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+    return out
+
+
+@njit(cache=True)
+def find_cell(lon, lat, bounds):
+    """Index of the (minx, miny, maxx, maxy) row containing the point, or -1.
+    
+    Cells are half-open, [minx, maxx) x [miny, maxy), so a point on an edge
+    shared by two cells belongs to exactly one of them regardless of order.
+    """
+    for i in range(bounds.shape[0]):
+        if bounds[i, 0] <= lon < bounds[i, 2] and bounds[i, 1] <= lat < bounds[i, 3]:
+            return i
+    return -1
+
+
+# Compile (or load from cache) at import so the first request doesn't pay for it
+haversine_km(0.0, 0.0, np.zeros(1), np.zeros(1), np.ones(1), np.empty(1))
+find_cell(0.0, 0.0, np.zeros((1, 4)))
@@ -0,0 +1,28 @@
+from typing import Optional
+
+import numpy as np
+from shapely import STRtree
+
+# Japan Plane Rectangular CS IX (Tokyo), in meters
+METRIC_CRS = "EPSG:6677"
+
+
+def max_intersecting_rank(
+    tree: Optional[STRtree], ranks: np.ndarray, geoms: np.ndarray, default: int = 1
+) -> np.ndarray:
+    """Highest rank among tree geometries intersecting each of geoms, default where none do."""
+    result = np.full(len(geoms), default, dtype=ranks.dtype)
+    if tree is None or len(geoms) == 0:
+        return result
+    
+    # One bulk query for all (query, tree) pairs, grouped by query index
+    src, tgt = tree.query(geoms, predicate="intersects")
+    if len(src) == 0:
+        return result
+    order = np.argsort(src, kind="stable")
+    src, tgt = src[order], tgt[order]
+    
+    # Max over each run of equal query indices
+    starts = np.flatnonzero(np.r_[True, src[1:] != src[:-1]])
+    result[src[starts]] = np.maximum.reduceat(ranks[tgt], starts)
+    return result
\ No newline at end of file
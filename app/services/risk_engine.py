@@ -1,137 +1,272 @@
-import json
+import functools
 import math
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping, Optional, Tuple
 
 import geopandas as gpd
 import numpy as np
+import orjson
+import pyogrio
+import shapely
+from pyproj import Transformer
+from shapely import STRtree
 from shapely.geometry import Point
-from shapely.ops import nearest_points
 
 from app.core.config import settings
 from app.models.responses import RiskScoreResponse
+from app.services._geo_kernels import find_cell
+from app.services._spatial import METRIC_CRS
+from app.services.shelter_service import ShelterService
+
+# Fixed order of risk factors, shared by the weight vector and per-request values
+FACTOR_ORDER = (
+    "population_density",
+    "residential_unit_count",
+    "building_stories",
+    "hazard_liquefaction_rank",
+    "flood_depth",
+    "proximity_to_shelter"
+)
+
+# Read-only fallback used when config/weights.json is absent
+_DEFAULT_WEIGHTS = MappingProxyType({
+    "weights": MappingProxyType({
+        "population_density": 0.25,
+        "residential_unit_count": 0.20,
+        "building_stories": 0.15,
+        "hazard_liquefaction_rank": 0.25,
+        "flood_depth": 0.10,
+        "proximity_to_shelter": -0.05
+    }),
+    "bands": MappingProxyType({
+        "low": (0, 0.33),
+        "medium": (0.33, 0.67),
+        "high": (0.67, 1.0)
+    })
+})
+
+# Data file locations, resolved once at import
+WEIGHTS_PATH = settings.config_dir / "weights.json"
+GRID_PATH = settings.mock_dir / "grid_500m.geojson"
+BUILDINGS_PATH = settings.mock_dir / "buildings.geojson"
+HAZARD_PATH = settings.mock_dir / "hazard_liq.geojson"
+
+_TO_METRIC = Transformer.from_crs("EPSG:4326", METRIC_CRS, always_xy=True)
 
 
 class RiskEngine:
     def __init__(self):
         self.weights = self._load_weights()
-        self._grid_data = None
-        self._buildings_data = None
-        self._hazard_data = None
-        self._shelters_data = None
+        self._weight_vec = np.array(
+            [self.weights["weights"].get(factor, 0.0) for factor in FACTOR_ORDER]
+        )
+        # Layer attributes as flat arrays, indexed by STRtree query results
+        self._grid_geom = np.empty(0, dtype=object)
+        self._grid_pop = np.empty(0, dtype=np.float32)
+        self._grid_bounds = None
+        self._bbox = None
+        self._buildings_geom = np.empty(0, dtype=object)
+        self._is_residential = np.empty(0, dtype=np.bool_)
+        self._building_levels = np.empty(0, dtype=np.float32)
+        self._hazard_geom = np.empty(0, dtype=object)
+        self._hazard_liq = np.empty(0, dtype=np.int32)
+        self._shelters = None
+        self._grid_tree = None
+        self._buildings_tree = None
+        self._hazard_tree = None
+        
+        # Per-instance memo of scores keyed on quantized coordinates
+        self._score_core = functools.lru_cache(maxsize=65536)(self._compute_score)
     
-    def _load_weights(self) -> Dict[str, Any]:
+    def _load_weights(self) -> Mapping[str, Any]:
         """Load risk calculation weights from config."""
-        weights_path = settings.config_dir / "weights.json"
         try:
-            with open(weights_path) as f:
-                return json.load(f)
+            return orjson.loads(WEIGHTS_PATH.read_bytes())
         except FileNotFoundError:
-            return {
-                "weights": {
-                    "population_density": 0.25,
-                    "residential_unit_count": 0.20,
-                    "building_stories": 0.15,
-                    "hazard_liquefaction_rank": 0.25,
-                    "flood_depth": 0.10,
-                    "proximity_to_shelter": -0.05
-                },
-                "bands": {
-                    "low": [0, 0.33],
-                    "medium": [0.33, 0.67], 
-                    "high": [0.67, 1.0]
-                }
-            }
+            return _DEFAULT_WEIGHTS
+    
+    def load(self):
+        """Load mock data files. Called once at application startup."""
+        grid = self._read_layer(GRID_PATH, ["pop_density"])
+        self._grid_geom = grid.geometry.to_numpy()
+        self._grid_pop = grid["pop_density"].to_numpy(np.float32)
+        self._grid_bounds = self._rectangle_bounds(self._grid_geom)
+        
+        # Buildings are stored in meters so the search radius needs no conversion
+        buildings = self._read_layer(BUILDINGS_PATH, ["use", "levels"])
+        buildings_bounds = buildings.total_bounds
+        buildings = buildings.to_crs(METRIC_CRS)
+        self._buildings_geom = buildings.geometry.to_numpy()
+        self._is_residential = (buildings["use"] == "residential").to_numpy(np.bool_)
+        # Buildings without a level count are treated as single-storey
+        self._building_levels = np.nan_to_num(buildings["levels"].to_numpy(np.float32), nan=1.0)
+        
+        hazards = self._read_layer(HAZARD_PATH, ["liq_rank"])
+        self._hazard_geom = hazards.geometry.to_numpy()
+        self._hazard_liq = hazards["liq_rank"].fillna(1).to_numpy(np.int32)
+        
+        self._bbox = self._data_bbox([grid.total_bounds, buildings_bounds, hazards.total_bounds])
+        
+        self._shelters = ShelterService()
+        
+        # Spatial indexes, built once so lookups only test nearby candidates
+        self._grid_tree = self._build_tree(self._grid_geom)
+        self._buildings_tree = self._build_tree(self._buildings_geom)
+        self._hazard_tree = self._build_tree(self._hazard_geom)
+        
+        self._score_core.cache_clear()
+    
+    def _read_layer(self, geojson_path: Path, columns: List[str]) -> gpd.GeoDataFrame:
+        """Read only the needed columns of a mock layer.
+        
+        Prefers a GeoParquet sibling (see scripts/convert_to_parquet.py) unless the
+        GeoJSON source is newer, and otherwise reads the GeoJSON via pyogrio's Arrow
+        path. Returns an empty frame with the requested columns if the layer is missing.
+        """
+        parquet_path = geojson_path.with_suffix(".parquet")
+        if parquet_path.exists() and (
+            not geojson_path.exists()
+            or parquet_path.stat().st_mtime >= geojson_path.stat().st_mtime
+        ):
+            gdf = gpd.read_parquet(parquet_path, columns=columns + ["geometry"])
+        elif geojson_path.exists():
+            gdf = pyogrio.read_dataframe(geojson_path, columns=columns, use_arrow=True)
+        else:
+            gdf = gpd.GeoDataFrame({column: [] for column in columns}, geometry=gpd.GeoSeries([]))
+        
+        if gdf.crs is None:
+            gdf = gdf.set_crs("EPSG:4326")
+        return gdf
+    
+    def _rectangle_bounds(self, geoms: np.ndarray) -> Optional[np.ndarray]:
+        """Return (N, 4) bounds if every geometry is an axis-aligned rectangle.
+        
+        Rectangular cells can be matched with a plain bounds test instead of GEOS.
+        """
+        if len(geoms) == 0:
+            return None
+        
+        bounds = shapely.bounds(geoms)
+        box_areas = (bounds[:, 2] - bounds[:, 0]) * (bounds[:, 3] - bounds[:, 1])
+        if not np.allclose(shapely.area(geoms), box_areas):
+            return None
+        return bounds
     
-    async def _load_data(self):
-        """Load mock data files if not already loaded."""
-        if self._grid_data is None:
-            grid_path = settings.mock_dir / "grid_500m.geojson"
-            if grid_path.exists():
-                self._grid_data = gpd.read_file(grid_path)
-            else:
-                self._grid_data = gpd.GeoDataFrame()
-        
-        if self._buildings_data is None:
-            buildings_path = settings.mock_dir / "buildings.geojson"
-            if buildings_path.exists():
-                self._buildings_data = gpd.read_file(buildings_path)
-            else:
-                self._buildings_data = gpd.GeoDataFrame()
-        
-        if self._hazard_data is None:
-            hazard_path = settings.mock_dir / "hazard_liq.geojson"
-            if hazard_path.exists():
-                self._hazard_data = gpd.read_file(hazard_path)
-            else:
-                self._hazard_data = gpd.GeoDataFrame()
+    def _data_bbox(self, layer_bounds: List[np.ndarray]) -> Optional[np.ndarray]:
+        """Combined (minx, miny, maxx, maxy) of all layers, padded for search radius.
+        
+        The 0.002 degree pad covers the 100m building search and coordinate snapping.
+        """
+        bounds = np.array([b for b in layer_bounds if not np.isnan(b).any()])
+        if len(bounds) == 0:
+            return None
+        
+        pad = 0.002
+        return np.array([
+            bounds[:, 0].min() - pad, bounds[:, 1].min() - pad,
+            bounds[:, 2].max() + pad, bounds[:, 3].max() + pad
+        ])
+    
+    def _build_tree(self, geoms: np.ndarray) -> Optional[STRtree]:
+        """Build an STRtree over a layer's geometries."""
+        if len(geoms) == 0:
+            return None
+        return STRtree(geoms)
     
-    async def calculate_risk_score(self, lat: float, lon: float) -> RiskScoreResponse:
+    def calculate_risk_score(self, lat: float, lon: float) -> RiskScoreResponse:
         """Calculate entrapment risk score for a given location."""
-        await self._load_data()
+        # Outside the loaded data there is nothing to look up
+        bb = self._bbox
+        if bb is not None and not (bb[0] <= lon <= bb[2] and bb[1] <= lat <= bb[3]):
+            return RiskScoreResponse(
+                risk_score=0.0,
+                band=self._get_risk_band(0.0),
+                top_contributors=[],
+                lat=lat,
+                lon=lon
+            )
         
+        # Bucket into 0.001 degree (~100m) lattice cells so nearby queries share a cache entry
+        lat_q = math.floor(lat * 1000)
+        lon_q = math.floor(lon * 1000)
+        risk_score, band, contributors = self._score_core(lat_q, lon_q)
+        
+        return RiskScoreResponse(
+            risk_score=risk_score,
+            band=band,
+            top_contributors=[dict(contributor) for contributor in contributors],
+            lat=lat,
+            lon=lon
+        )
+    
+    def _compute_score(self, lat_q: int, lon_q: int) -> Tuple[float, str, Tuple[Dict[str, Any], ...]]:
+        """Compute risk score, band and top contributors for a quantized location."""
+        # Evaluate at the lattice cell centre. With the mock layers, whose edges fall on
+        # multiples of 0.005 degrees, a centre never lies on an edge, so the answer comes
+        # from the cell holding the query. Layers with arbitrary edges can still put a
+        # query near an edge into a neighbouring cell: a known limit of snapping. The
+        # 100m building search also runs from the centre, up to ~70m from the query.
+        lat = (lat_q + 0.5) / 1000.0
+        lon = (lon_q + 0.5) / 1000.0
         point = Point(lon, lat)
         
         # Initialize risk factors
-        factors = {
-            "population_density": 0.0,
-            "residential_unit_count": 0.0,
-            "building_stories": 0.0,
-            "hazard_liquefaction_rank": 0.0,
-            "flood_depth": 0.0,
-            "proximity_to_shelter": 0.0
-        }
+        factors = dict.fromkeys(FACTOR_ORDER, 0.0)
         
         contributors = []
         
         # Get grid cell data
-        if not self._grid_data.empty:
-            grid_cell = self._find_containing_cell(point, self._grid_data)
-            if grid_cell is not None:
-                factors["population_density"] = grid_cell.get("pop_density", 0.0) / 1000.0  # Normalize
-                contributors.append({
-                    "factor": "population_density",
-                    "value": factors["population_density"],
-                    "description": f"Population density: {grid_cell.get('pop_density', 0)}/km²"
-                })
+        cell_idx = self._find_grid_cell(lon, lat)
+        if cell_idx is not None:
+            pop_density = float(self._grid_pop[cell_idx])
+            factors["population_density"] = pop_density / 1000.0  # Normalize
+            contributors.append({
+                "factor": "population_density",
+                "value": factors["population_density"],
+                "description": f"Population density: {pop_density:.0f}/km²"
+            })
         
         # Get building data
-        if not self._buildings_data.empty:
-            nearby_buildings = self._get_nearby_buildings(point, self._buildings_data, radius_m=100)
-            if len(nearby_buildings) > 0:
-                residential_count = len(nearby_buildings[nearby_buildings.get("use", "") == "residential"])
-                avg_stories = nearby_buildings.get("levels", 1).mean()
-                
-                factors["residential_unit_count"] = min(residential_count / 10.0, 1.0)  # Normalize
-                factors["building_stories"] = min(avg_stories / 20.0, 1.0)  # Normalize
-                
-                contributors.extend([
-                    {
-                        "factor": "residential_unit_count", 
-                        "value": factors["residential_unit_count"],
-                        "description": f"Residential buildings: {residential_count}"
-                    },
-                    {
-                        "factor": "building_stories",
-                        "value": factors["building_stories"], 
-                        "description": f"Average stories: {avg_stories:.1f}"
-                    }
-                ])
+        nearby_idx = self._get_nearby_buildings(lon, lat, radius_m=100)
+        if len(nearby_idx) > 0:
+            residential_count = int(np.count_nonzero(self._is_residential[nearby_idx]))
+            avg_stories = float(self._building_levels[nearby_idx].mean())
+            
+            factors["residential_unit_count"] = min(residential_count / 10.0, 1.0)  # Normalize
+            factors["building_stories"] = min(avg_stories / 20.0, 1.0)  # Normalize
+            
+            contributors.extend([
+                {
+                    "factor": "residential_unit_count", 
+                    "value": factors["residential_unit_count"],
+                    "description": f"Residential buildings: {residential_count}"
+                },
+                {
+                    "factor": "building_stories",
+                    "value": factors["building_stories"], 
+                    "description": f"Average stories: {avg_stories:.1f}"
+                }
+            ])
         
         # Get hazard data
-        if not self._hazard_data.empty:
-            hazard = self._find_containing_cell(point, self._hazard_data)
-            if hazard is not None:
-                liq_rank = hazard.get("liq_rank", 1)
-                factors["hazard_liquefaction_rank"] = liq_rank / 5.0  # Assuming rank 1-5
-                contributors.append({
-                    "factor": "hazard_liquefaction_rank",
-                    "value": factors["hazard_liquefaction_rank"],
-                    "description": f"Liquefaction risk: {liq_rank}/5"
-                })
-        
-        # Calculate proximity to nearest shelter (mock)
-        shelter_distance = 500.0  # Mock distance in meters
+        hazard_idx = self._find_containing_cell(point, self._hazard_tree)
+        if hazard_idx is not None:
+            liq_rank = int(self._hazard_liq[hazard_idx])
+            factors["hazard_liquefaction_rank"] = liq_rank / 5.0  # Assuming rank 1-5
+            contributors.append({
+                "factor": "hazard_liquefaction_rank",
+                "value": factors["hazard_liquefaction_rank"],
+                "description": f"Liquefaction risk: {liq_rank}/5"
+            })
+        
+        # Calculate proximity to nearest shelter
+        shelter_distance = 500.0  # Mock distance in meters when no shelters are loaded
+        distances_km = (
+            self._shelters.distances_km(lat, lon) if self._shelters is not None else np.empty(0)
+        )
+        if len(distances_km):
+            shelter_distance = round(float(distances_km.min()) * 1000.0, 1)
         factors["proximity_to_shelter"] = min(shelter_distance / 1000.0, 1.0)  # Normalize to km
         contributors.append({
             "factor": "proximity_to_shelter",
@@ -140,11 +275,8 @@ class RiskEngine:
         })
         
         # Calculate weighted risk score
-        risk_score = 0.0
-        weights = self.weights["weights"]
-        for factor, value in factors.items():
-            if factor in weights:
-                risk_score += weights[factor] * value
+        values = [factors[factor] for factor in FACTOR_ORDER]
+        risk_score = float(np.dot(self._weight_vec, values))
         
         # Normalize to 0-1 range
         risk_score = max(0.0, min(1.0, risk_score))
@@ -152,56 +284,50 @@ class RiskEngine:
         # Determine risk band
         band = self._get_risk_band(risk_score)
         
-        # Sort contributors by impact
-        contributors.sort(key=lambda x: abs(x["value"] * weights.get(x["factor"], 0)), reverse=True)
+        # Rank contributors by impact (|weight * value|), largest first
+        by_factor = {contributor["factor"]: contributor for contributor in contributors}
+        ranked = np.argsort(-np.abs(self._weight_vec * values), kind="stable")
+        contributors = [
+            by_factor[FACTOR_ORDER[i]] for i in ranked if FACTOR_ORDER[i] in by_factor
+        ]
         
-        return RiskScoreResponse(
-            risk_score=risk_score,
-            band=band,
-            top_contributors=contributors[:5],
-            lat=lat,
-            lon=lon
-        )
+        return risk_score, band, tuple(contributors[:5])
     
-    def _find_containing_cell(self, point: Point, gdf: gpd.GeoDataFrame) -> Optional[Dict]:
-        """Find the cell that contains the given point."""
-        if gdf.empty:
+    def _find_containing_cell(self, point: Point, tree: Optional[STRtree]) -> Optional[int]:
+        """Find the index of the polygon that contains the given point."""
+        if tree is None:
             return None
         
-        try:
-            # Ensure CRS compatibility
-            if gdf.crs is None:
-                gdf = gdf.set_crs("EPSG:4326")
-            
-            containing = gdf[gdf.contains(point)]
-            if not containing.empty:
-                return containing.iloc[0].to_dict()
-        except Exception:
-            pass
-        
+        # "within" tests the query point against each candidate polygon
+        idx = tree.query(point, predicate="within")
+        if len(idx):
+            return int(idx[0])
         return None
     
-    def _get_nearby_buildings(self, point: Point, buildings_gdf: gpd.GeoDataFrame, radius_m: float = 100) -> gpd.GeoDataFrame:
-        """Get buildings within radius of point."""
-        if buildings_gdf.empty:
-            return gpd.GeoDataFrame()
+    def _find_grid_cell(self, lon: float, lat: float) -> Optional[int]:
+        """Find the index of the grid cell containing the given coordinates."""
+        if self._grid_bounds is None:
+            return self._find_containing_cell(Point(lon, lat), self._grid_tree)
         
-        try:
-            # Simple distance filter (approximate)
-            nearby = buildings_gdf[
-                buildings_gdf.geometry.distance(point) < (radius_m / 111000.0)  # Rough meters to degrees
-            ]
-            return nearby
-        except Exception:
-            return gpd.GeoDataFrame()
+        idx = find_cell(lon, lat, self._grid_bounds)
+        return int(idx) if idx >= 0 else None
+    
+    def _get_nearby_buildings(self, lon: float, lat: float, radius_m: float = 100) -> np.ndarray:
+        """Get indices of buildings within radius (meters) of the given coordinates."""
+        if self._buildings_tree is None:
+            return np.empty(0, dtype=np.intp)
+        
+        x, y = _TO_METRIC.transform(lon, lat)
+        
+        # Bounding-box candidates from the tree, then exact distance on survivors only
+        search_box = shapely.box(x - radius_m, y - radius_m, x + radius_m, y + radius_m)
+        candidates = self._buildings_tree.query(search_box)
+        distances = shapely.distance(self._buildings_geom[candidates], Point(x, y))
+        return candidates[distances < radius_m]
     
     def _get_risk_band(self, risk_score: float) -> str:
         """Determine risk band based on score."""
-        bands = self.weights.get("bands", {
-            "low": [0, 0.33],
-            "medium": [0.33, 0.67],
-            "high": [0.67, 1.0]
-        })
+        bands = self.weights.get("bands", _DEFAULT_WEIGHTS["bands"])
         
         for band, (low, high) in bands.items():
             if low <= risk_score < high:
@@ -1,110 +1,65 @@
 import math
 from typing import List
-from shapely.geometry import Point
 
+import numpy as np
+
+from app.core.config import settings
 from app.models.responses import ShelterResponse
+from app.services._geo_kernels import haversine_km
+
+# Built by scripts/build_shelters_npz.py
+SHELTERS_PATH = settings.data_dir / "shelters.npz"
 
 
 class ShelterService:
     def __init__(self):
-        # Mock shelter data for Tokyo wards
-        self.mock_shelters = [
-            {
-                "id": "shelter_001",
-                "name": "Tokyo Metropolitan Gymnasium",
-                "lat": 35.6762,
-                "lon": 139.7116,
-                "capacity": 5000
-            },
-            {
-                "id": "shelter_002", 
-                "name": "Shibuya City Community Center",
-                "lat": 35.6598,
-                "lon": 139.7006,
-                "capacity": 2500
-            },
-            {
-                "id": "shelter_003",
-                "name": "Shinjuku Park Hyatt Emergency Center",
-                "lat": 35.6935,
-                "lon": 139.6917,
-                "capacity": 3000
-            },
-            {
-                "id": "shelter_004",
-                "name": "Minato Ward Civic Center",
-                "lat": 35.6584,
-                "lon": 139.7519,
-                "capacity": 1800
-            },
-            {
-                "id": "shelter_005",
-                "name": "Chiyoda Ward Emergency Facility",
-                "lat": 35.6938,
-                "lon": 139.7531,
-                "capacity": 2200
-            },
-            {
-                "id": "shelter_006",
-                "name": "Taito Cultural Center",
-                "lat": 35.7139,
-                "lon": 139.7794,
-                "capacity": 1500
-            }
-        ]
+        # Without the archive every lookup would silently return no shelters
+        if not SHELTERS_PATH.exists():
+            raise FileNotFoundError(
+                f"Shelter data {SHELTERS_PATH.resolve()} not found; "
+                "run scripts/build_shelters_npz.py from the project root"
+            )
+        
+        # Shelter fields as parallel arrays
+        with np.load(SHELTERS_PATH) as shelters:
+            self._ids = shelters["ids"]
+            self._names = shelters["names"]
+            self._lat_deg = shelters["lats"]
+            self._lon_deg = shelters["lons"]
+            self._cap = shelters["cap"]
+        
+        # Shelter coordinates in radians for the haversine kernel
+        self._lats = np.deg2rad(self._lat_deg)
+        self._lons = np.deg2rad(self._lon_deg)
+        self._cos_lats = np.cos(self._lats)
+    
+    def distances_km(self, lat: float, lon: float) -> np.ndarray:
+        """Haversine distance (km) from the given location to every shelter."""
+        return haversine_km(
+            math.radians(lat), math.radians(lon),
+            self._lats, self._lons, self._cos_lats, np.empty_like(self._lats)
+        )
     
-    async def find_nearby_shelters(self, lat: float, lon: float, limit: int = 3) -> List[ShelterResponse]:
+    def find_nearby_shelters(self, lat: float, lon: float, limit: int = 3) -> List[ShelterResponse]:
         """Find nearby emergency shelters."""
-        user_point = Point(lon, lat)
-        
-        # Calculate distances and create shelter responses
-        shelters_with_distance = []
-        for shelter in self.mock_shelters:
-            shelter_point = Point(shelter["lon"], shelter["lat"])
-            distance_km = self._calculate_distance(user_point, shelter_point)
-            
-            shelters_with_distance.append({
-                **shelter,
-                "distance_km": distance_km
-            })
+        distances_km = self.distances_km(lat, lon)
         
-        # Sort by distance and limit results
-        shelters_with_distance.sort(key=lambda x: x["distance_km"])
-        nearest_shelters = shelters_with_distance[:limit]
+        # Select the closest shelters, then order just those by distance
+        if limit < len(distances_km):
+            nearest = np.argpartition(distances_km, limit)[:limit]
+        else:
+            nearest = np.arange(len(distances_km))
+        nearest = nearest[np.argsort(distances_km[nearest])]
         
         # Convert to response models
         return [
             ShelterResponse(
-                id=shelter["id"],
-                name=shelter["name"],
-                lat=shelter["lat"],
-                lon=shelter["lon"],
-                distance_km=round(shelter["distance_km"], 2),
-                capacity=shelter["capacity"]
+                id=str(self._ids[i]),
+                name=str(self._names[i]),
+                lat=float(self._lat_deg[i]),
+                lon=float(self._lon_deg[i]),
+                distance_km=round(float(distances_km[i]), 2),
+                capacity=int(self._cap[i])
             )
-            for shelter in nearest_shelters
-        ]
-    
-    def _calculate_distance(self, point1: Point, point2: Point) -> float:
-        """Calculate distance between two points in kilometers using haversine formula."""
-        lat1, lon1 = point1.y, point1.x
-        lat2, lon2 = point2.y, point2.x
-        
-        # Convert to radians
-        lat1_rad = math.radians(lat1)
-        lon1_rad = math.radians(lon1)
-        lat2_rad = math.radians(lat2)
-        lon2_rad = math.radians(lon2)
-        
-        # Haversine formula
-        dlat = lat2_rad - lat1_rad
-        dlon = lon2_rad - lon1_rad
-        
-        a = (math.sin(dlat / 2) ** 2 + 
-             math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2)
-        c = 2 * math.asin(math.sqrt(a))
-        
-        # Earth's radius in kilometers
-        r = 6371
-        
-        return r * c
\ No newline at end of file
+            for i in nearest
+        ]
\ No newline at end of file
@@ -1,46 +1,75 @@
+import functools
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 
 from fastapi import HTTPException
-from fastapi.responses import Response
+from pmtiles.reader import MmapSource, Reader
 
 from app.core.config import settings
 
 
 class TileService:
-    def __init__(self):
-        self.tiles_path = Path(settings.tiles_path)
+    def __init__(self, tiles_path: Optional[Path] = None):
+        self.tiles_path = Path(tiles_path or settings.tiles_path)
+        self._reader: Optional[Reader] = None
+        self._mtime_ns: Optional[int] = None
+        
+        # Per-instance memo of raw tile bytes keyed on (z, x, y)
+        self._read_tile = functools.lru_cache(maxsize=4096)(self._read_tile_uncached)
+        self._refresh()
     
-    async def get_tile(self, z: int, x: int, y: int) -> bytes:
-        """Get vector tile data."""
-        # For now, return empty tile data since we don't have actual PMTiles
-        # In a real implementation, this would:
-        # 1. Check if PMTiles file exists
-        # 2. Use pmtiles library to extract tile data
-        # 3. Return the tile as protobuf bytes
+    def _open_reader(self) -> Optional[Reader]:
+        """Memory-map the PMTiles archive once so tile reads hit the page cache."""
+        if not self.tiles_path.exists() or self.tiles_path.stat().st_size == 0:
+            return None
         
-        if not self.tiles_path.exists():
-            # Return empty vector tile
-            return self._create_empty_tile()
+        # The mapping keeps its own handle, so the file object can be closed
+        with open(self.tiles_path, "rb") as f:
+            return Reader(MmapSource(f))
+    
+    def _refresh(self) -> None:
+        """Reopen the archive if it was rebuilt since it was last opened."""
+        try:
+            mtime_ns = self.tiles_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = 0
         
+        # A new mtime means new ETags and no stale tiles from the old mapping
+        if mtime_ns != self._mtime_ns:
+            self._mtime_ns = mtime_ns
+            self._reader = self._open_reader()
+            self._read_tile.cache_clear()
+    
+    async def get_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """Get vector tile data, or None if the archive has no such tile."""
         try:
-            # Mock tile serving - in real implementation would use pmtiles
-            return self._create_mock_tile(z, x, y)
+            self._refresh()
+            return self._read_tile(z, x, y)
         except Exception as e:
             raise HTTPException(status_code=404, detail=f"Tile not found: {str(e)}")
     
-    def _create_empty_tile(self) -> bytes:
-        """Create an empty vector tile."""
-        # This is a minimal empty Mapbox Vector Tile
-        return b'\x00'
+    def _read_tile_uncached(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """Read a tile from the archive, or None if unavailable."""
+        if self._reader is None:
+            return None
+        return self._reader.get(z, x, y)
     
-    def _create_mock_tile(self, z: int, x: int, y: int) -> bytes:
-        """Create a mock tile with sample data."""
-        # In a real implementation, this would use the pmtiles library:
-        # from pmtiles.reader import MemorySource, Reader
-        # reader = Reader(MemorySource(open(self.tiles_path, 'rb').read()))
-        # tile_data = reader.get(z, x, y)
-        
-        # For now, return empty tile
-        return self._create_empty_tile()
\ No newline at end of file
+    def etag(self, z: int, x: int, y: int) -> str:
+        """ETag for a tile, tied to the archive's modification time."""
+        return f'"{z}-{x}-{y}-{self._mtime_ns}"'
+    
+    def cache_headers(self, z: int, x: int, y: int, found: bool) -> Dict[str, str]:
+        """HTTP caching headers for a tile response."""
+        # Missing tiles must be revalidated so they appear once the archive is rebuilt
+        if found:
+            cache_control = "public, max-age=31536000, immutable"
+        else:
+            cache_control = "no-cache"
+        return {
+            "Cache-Control": cache_control,
+            "ETag": self.etag(z, x, y)
+        }
+
+
+tile_service = TileService()
\ No newline at end of file
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Build the shelter dataset used by the API as a NumPy .npz archive.
+Each field is stored as its own array (ids, names, lats, lons, cap).
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.services.shelter_service import SHELTERS_PATH
+
+
+# Mock shelter data for Tokyo wards
+MOCK_SHELTERS = [
+    {
+        "id": "shelter_001",
+        "name": "Tokyo Metropolitan Gymnasium",
+        "lat": 35.6762,
+        "lon": 139.7116,
+        "capacity": 5000
+    },
+    {
+        "id": "shelter_002", 
+        "name": "Shibuya City Community Center",
+        "lat": 35.6598,
+        "lon": 139.7006,
+        "capacity": 2500
+    },
+    {
+        "id": "shelter_003",
+        "name": "Shinjuku Park Hyatt Emergency Center",
+        "lat": 35.6935,
+        "lon": 139.6917,
+        "capacity": 3000
+    },
+    {
+        "id": "shelter_004",
+        "name": "Minato Ward Civic Center",
+        "lat": 35.6584,
+        "lon": 139.7519,
+        "capacity": 1800
+    },
+    {
+        "id": "shelter_005",
+        "name": "Chiyoda Ward Emergency Facility",
+        "lat": 35.6938,
+        "lon": 139.7531,
+        "capacity": 2200
+    },
+    {
+        "id": "shelter_006",
+        "name": "Taito Cultural Center",
+        "lat": 35.7139,
+        "lon": 139.7794,
+        "capacity": 1500
+    }
+]
+
+
+def build_shelters_npz(shelters, output_path):
+    """Write shelters to an .npz archive with one array per field."""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(
+        output_path,
+        ids=np.array([shelter["id"] for shelter in shelters]),
+        names=np.array([shelter["name"] for shelter in shelters]),
+        lats=np.array([shelter["lat"] for shelter in shelters], dtype=np.float64),
+        lons=np.array([shelter["lon"] for shelter in shelters], dtype=np.float64),
+        cap=np.array([shelter["capacity"] for shelter in shelters], dtype=np.int32)
+    )
+    print(f"Saved {len(shelters)} shelters to {output_path}")
+
+
+def main():
+    """Build the shelter archive."""
+    build_shelters_npz(MOCK_SHELTERS, SHELTERS_PATH)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -9,6 +9,8 @@ import subprocess
 import sys
 from pathlib import Path
 
+import geopandas as gpd
+
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 
@@ -25,14 +27,27 @@ def check_tippecanoe():
         return False
 
 
+def export_risk_geojson(parquet_file, geojson_file):
+    """Export the computed GeoParquet grid to GeoJSON for tippecanoe, unless already up to date."""
+    if geojson_file.exists() and geojson_file.stat().st_mtime >= parquet_file.stat().st_mtime:
+        return
+    
+    gpd.read_parquet(parquet_file).to_file(geojson_file, driver='GeoJSON', engine='pyogrio')
+    print(f"Exported {parquet_file} to {geojson_file}")
+
+
 def build_risk_tiles():
     """Build risk heatmap tiles from computed data."""
     # Input: computed risk grid
-    input_file = Path("data/computed/risk_grid.geojson")
-    if not input_file.exists():
-        print(f"Error: {input_file} not found. Run 'make compute' first.")
+    parquet_file = Path("data/computed/risk_grid.parquet")
+    if not parquet_file.exists():
+        print(f"Error: {parquet_file} not found. Run 'make compute' first.")
         return False
     
+    # Tippecanoe reads GeoJSON
+    input_file = parquet_file.with_suffix('.geojson')
+    export_risk_geojson(parquet_file, input_file)
+    
     # Output: PMTiles file
     output_file = settings.tiles_dir / "risk.pmtiles"
     output_file.parent.mkdir(parents=True, exist_ok=True)
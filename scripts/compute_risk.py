@@ -4,25 +4,33 @@ Risk computation script for Tokyo Disaster Entrapment Assessment.
 Joins mock data layers and computes risk scores for grid cells.
 """
 
-import json
+import argparse
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 import geopandas as gpd
 import numpy as np
+import orjson
 import pandas as pd
-from shapely.geometry import Point
+import shapely
+from numba import njit, prange
+from scipy.spatial import cKDTree
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from app.core.config import settings
+from app.services._spatial import METRIC_CRS, max_intersecting_rank
 
 
+@lru_cache(maxsize=1)
 def load_weights():
-    """Load risk calculation weights."""
+    """Load risk calculation weights (parsed once per process)."""
     weights_path = settings.config_dir / "weights.json"
-    if not weights_path.exists():
+    try:
+        return orjson.loads(weights_path.read_bytes())
+    except FileNotFoundError:
         print(f"Warning: {weights_path} not found, using default weights")
         return {
             "weights": {
@@ -34,19 +42,16 @@ def load_weights():
                 "proximity_to_shelter": -0.05
             }
         }
-    
-    with open(weights_path) as f:
-        return json.load(f)
 
 
-def load_mock_data():
-    """Load all mock data files."""
+def load_mock_data(bbox=None):
+    """Load all mock data files, optionally only features intersecting bbox (minx, miny, maxx, maxy)."""
     data = {}
     
     # Load grid
     grid_path = settings.mock_dir / "grid_500m.geojson"
     if grid_path.exists():
-        data['grid'] = gpd.read_file(grid_path)
+        data['grid'] = gpd.read_file(grid_path, bbox=bbox, engine='pyogrio')
         print(f"Loaded {len(data['grid'])} grid cells")
     else:
         print(f"Warning: {grid_path} not found")
@@ -55,7 +60,7 @@ def load_mock_data():
     # Load buildings
     buildings_path = settings.mock_dir / "buildings.geojson"
     if buildings_path.exists():
-        data['buildings'] = gpd.read_file(buildings_path)
+        data['buildings'] = gpd.read_file(buildings_path, bbox=bbox, engine='pyogrio')
         print(f"Loaded {len(data['buildings'])} buildings")
     else:
         print(f"Warning: {buildings_path} not found")
@@ -64,7 +69,7 @@ def load_mock_data():
     # Load hazards
     hazard_path = settings.mock_dir / "hazard_liq.geojson"
     if hazard_path.exists():
-        data['hazards'] = gpd.read_file(hazard_path)
+        data['hazards'] = gpd.read_file(hazard_path, bbox=bbox, engine='pyogrio')
         print(f"Loaded {len(data['hazards'])} hazard zones")
     else:
         print(f"Warning: {hazard_path} not found")
@@ -74,75 +79,44 @@ def load_mock_data():
 
 
 def compute_building_metrics(grid_gdf, buildings_gdf):
-    """Compute building-related metrics for each grid cell."""
+    """Compute building-related metrics for each grid cell, indexed like the grid."""
+    columns = ['total_units', 'avg_building_stories', 'residential_building_count']
     if buildings_gdf.empty:
-        grid_gdf['residential_unit_count'] = 0
-        grid_gdf['avg_building_stories'] = 0
-        return grid_gdf
-    
-    # Ensure same CRS
-    if grid_gdf.crs != buildings_gdf.crs:
-        buildings_gdf = buildings_gdf.to_crs(grid_gdf.crs)
+        return pd.DataFrame(0, index=grid_gdf.index, columns=columns)
     
     # Spatial join to get buildings in each grid cell
     joined = gpd.sjoin(buildings_gdf, grid_gdf, how='left', predicate='within')
     
-    # Compute metrics per grid cell
-    building_metrics = joined.groupby('index_right').agg({
-        'units': 'sum',
-        'levels': 'mean',
-        'use': lambda x: (x == 'residential').sum()
-    }).rename(columns={
-        'units': 'total_units',
-        'levels': 'avg_building_stories',
-        'use': 'residential_building_count'
-    })
-    
-    # Merge back to grid
-    grid_gdf = grid_gdf.merge(
-        building_metrics, 
-        left_index=True, 
-        right_index=True, 
-        how='left'
-    ).fillna(0)
-    
-    return grid_gdf
+    # Compute metrics per grid cell with built-in reducers only
+    joined['is_residential'] = (joined['use'] == 'residential').astype(np.int32)
+    building_metrics = joined.groupby('index_right').agg(
+        total_units=('units', 'sum'),
+        avg_building_stories=('levels', 'mean'),
+        residential_building_count=('is_residential', 'sum')
+    )
+    
+    # Cells without buildings get zeros
+    building_metrics = building_metrics.astype({'avg_building_stories': np.float32})
+    return building_metrics.reindex(grid_gdf.index, fill_value=0)
 
 
 def compute_hazard_metrics(grid_gdf, hazards_gdf):
-    """Compute hazard-related metrics for each grid cell."""
+    """Compute the highest liquefaction rank for each grid cell, indexed like the grid."""
     if hazards_gdf.empty:
-        grid_gdf['hazard_liq_rank'] = 1
-        return grid_gdf
-    
-    # Ensure same CRS
-    if grid_gdf.crs != hazards_gdf.crs:
-        hazards_gdf = hazards_gdf.to_crs(grid_gdf.crs)
-    
-    # For each grid cell, find overlapping hazard with highest rank
-    grid_with_hazards = []
-    
-    for idx, grid_cell in grid_gdf.iterrows():
-        # Find overlapping hazards
-        overlapping = hazards_gdf[hazards_gdf.intersects(grid_cell.geometry)]
-        
-        if not overlapping.empty:
-            # Take the highest liquefaction rank
-            max_rank = overlapping['liq_rank'].max()
-            grid_cell_copy = grid_cell.copy()
-            grid_cell_copy['hazard_liq_rank'] = max_rank
-            grid_with_hazards.append(grid_cell_copy)
-        else:
-            # No hazard overlap, use default low risk
-            grid_cell_copy = grid_cell.copy()
-            grid_cell_copy['hazard_liq_rank'] = 1
-            grid_with_hazards.append(grid_cell_copy)
-    
-    return gpd.GeoDataFrame(grid_with_hazards)
+        return pd.Series(np.ones(len(grid_gdf), dtype=np.int8), index=grid_gdf.index)
+    
+    # Bulk-query every grid cell against an STRtree over the hazards; no overlap keeps the default low risk
+    tree = shapely.STRtree(hazards_gdf.geometry.values)
+    ranks = max_intersecting_rank(
+        tree,
+        hazards_gdf['liq_rank'].fillna(1).to_numpy(dtype=np.int8),
+        grid_gdf.geometry.values
+    )
+    return pd.Series(ranks, index=grid_gdf.index)
 
 
 def compute_shelter_proximity(grid_gdf):
-    """Compute proximity to nearest shelter (mock)."""
+    """Compute distance to the nearest shelter (mock) for each grid cell, indexed like the grid."""
     # Mock shelter locations (Tokyo major evacuation centers)
     shelter_locations = [
         (139.7116, 35.6762),  # Tokyo Metropolitan Gymnasium
@@ -152,101 +126,108 @@ def compute_shelter_proximity(grid_gdf):
         (139.7531, 35.6938),  # Chiyoda
     ]
     
-    shelter_distances = []
+    # Project cell centroids and shelters to meters once
+    centroid_coords = shapely.get_coordinates(
+        shapely.centroid(grid_gdf.geometry.to_crs(METRIC_CRS).values)
+    )
+    shelters = gpd.GeoSeries(
+        shapely.points(shelter_locations), crs="EPSG:4326"
+    ).to_crs(METRIC_CRS)
     
-    for idx, grid_cell in grid_gdf.iterrows():
-        # Get centroid of grid cell
-        centroid = grid_cell.geometry.centroid
-        
-        # Calculate distance to nearest shelter (rough approximation)
-        min_distance = float('inf')
-        for shelter_lon, shelter_lat in shelter_locations:
-            # Simple Euclidean distance (approximate)
-            distance = np.sqrt(
-                (centroid.x - shelter_lon)**2 + 
-                (centroid.y - shelter_lat)**2
-            ) * 111000  # Rough conversion to meters
-            min_distance = min(min_distance, distance)
-        
-        shelter_distances.append(min_distance)
+    # Nearest shelter to every cell centroid in one tree query
+    tree = cKDTree(shapely.get_coordinates(shelters.values))
+    distances, _ = tree.query(centroid_coords, k=1)
     
-    grid_gdf['shelter_distance_m'] = shelter_distances
-    return grid_gdf
+    return pd.Series(distances.astype(np.float32), index=grid_gdf.index)
+
+
+# Score factors in the column order of the normalized factor matrix
+FACTOR_NAMES = (
+    'population_density',
+    'residential_unit_count',
+    'building_stories',
+    'hazard_liquefaction_rank',
+    'flood_depth',
+    'proximity_to_shelter',
+)
+
+
+@njit(parallel=True, cache=True)
+def _score(pop, units, stories, liq, shelter, max_pop, max_dist, weights, norm, out):
+    """Normalize every factor, weight and clip the score in one pass over the cells."""
+    for i in prange(out.shape[0]):
+        norm[i, 0] = pop[i] / max_pop
+        norm[i, 1] = min(max(units[i] / 100.0, 0.0), 1.0)
+        norm[i, 2] = min(max(stories[i] / 30.0, 0.0), 1.0)
+        norm[i, 3] = (liq[i] - 1.0) / 4.0
+        norm[i, 4] = 0.0  # Flood depth (mock)
+        norm[i, 5] = shelter[i] / max_dist
+        
+        score = 0.0
+        for k in range(norm.shape[1]):
+            score += weights[k] * norm[i, k]
+        out[i] = min(max(score, 0.0), 1.0)
+
+
+def _factor_column(grid_gdf, column, default):
+    """Return a grid column as float32 with NaN as 0, or a constant array if it is missing."""
+    if column in grid_gdf.columns:
+        return np.nan_to_num(grid_gdf[column].to_numpy(dtype=np.float32), nan=0.0)
+    return np.full(len(grid_gdf), default, dtype=np.float32)
 
 
 def compute_risk_scores(grid_gdf, weights_config):
     """Compute final risk scores for each grid cell."""
     weights = weights_config['weights']
     
-    # Normalize factors to 0-1 range
-    normalized_factors = {}
+    # Raw factors; a missing column normalizes to 0 (rank 1 for hazards, 0.5 for shelters)
+    pop = _factor_column(grid_gdf, 'pop_density', 0)
+    units = _factor_column(grid_gdf, 'total_units', 0)
+    stories = _factor_column(grid_gdf, 'avg_building_stories', 0)
+    liq = _factor_column(grid_gdf, 'hazard_liq_rank', 1)
+    shelter = _factor_column(grid_gdf, 'shelter_distance_m', 0.5)
     
-    # Population density (normalize by max value)
-    if 'pop_density' in grid_gdf.columns:
-        max_pop = grid_gdf['pop_density'].max() if grid_gdf['pop_density'].max() > 0 else 1
-        normalized_factors['population_density'] = grid_gdf['pop_density'] / max_pop
-    else:
-        normalized_factors['population_density'] = np.zeros(len(grid_gdf))
-    
-    # Residential units (normalize by reasonable max)
-    if 'total_units' in grid_gdf.columns:
-        normalized_factors['residential_unit_count'] = np.clip(grid_gdf['total_units'] / 100.0, 0, 1)
-    else:
-        normalized_factors['residential_unit_count'] = np.zeros(len(grid_gdf))
-    
-    # Building stories (normalize by reasonable max)
-    if 'avg_building_stories' in grid_gdf.columns:
-        normalized_factors['building_stories'] = np.clip(grid_gdf['avg_building_stories'] / 30.0, 0, 1)
-    else:
-        normalized_factors['building_stories'] = np.zeros(len(grid_gdf))
-    
-    # Hazard liquefaction rank (already 1-5, normalize to 0-1)
-    if 'hazard_liq_rank' in grid_gdf.columns:
-        normalized_factors['hazard_liquefaction_rank'] = (grid_gdf['hazard_liq_rank'] - 1) / 4.0
-    else:
-        normalized_factors['hazard_liquefaction_rank'] = np.zeros(len(grid_gdf))
-    
-    # Flood depth (mock - set to 0 for now)
-    normalized_factors['flood_depth'] = np.zeros(len(grid_gdf))
-    
-    # Proximity to shelter (inverse - closer is better, normalize by max distance)
+    # Population and shelter distance are normalized by their max value
+    max_pop = pop.max() if pop.max() > 0 else 1
     if 'shelter_distance_m' in grid_gdf.columns:
-        max_distance = grid_gdf['shelter_distance_m'].max() if grid_gdf['shelter_distance_m'].max() > 0 else 1
-        normalized_factors['proximity_to_shelter'] = grid_gdf['shelter_distance_m'] / max_distance
+        max_dist = shelter.max() if shelter.max() > 0 else 1
     else:
-        normalized_factors['proximity_to_shelter'] = np.ones(len(grid_gdf)) * 0.5
-    
-    # Calculate weighted risk score
-    risk_scores = np.zeros(len(grid_gdf))
-    
-    for factor, values in normalized_factors.items():
-        if factor in weights:
-            risk_scores += weights[factor] * values
-            # Add normalized factors to dataframe for inspection
-            grid_gdf[f'norm_{factor}'] = values
-    
-    # Normalize final scores to 0-1
-    risk_scores = np.clip(risk_scores, 0, 1)
-    grid_gdf['risk_score'] = risk_scores
+        max_dist = 1
+    
+    # Normalize, weight and clip in a single fused kernel
+    weight_vec = np.array([weights.get(factor, 0.0) for factor in FACTOR_NAMES], dtype=np.float32)
+    factor_matrix = np.empty((len(grid_gdf), len(FACTOR_NAMES)), dtype=np.float32)
+    risk_scores = np.empty(len(grid_gdf), dtype=np.float32)
+    _score(
+        pop, units, stories, liq, shelter,
+        np.float32(max_pop), np.float32(max_dist), weight_vec, factor_matrix, risk_scores
+    )
+    
+    # Add normalized factors to dataframe for inspection
+    grid_gdf = grid_gdf.assign(**{
+        f'norm_{factor}': factor_matrix[:, i]
+        for i, factor in enumerate(FACTOR_NAMES) if factor in weights
+    })
     
-    # Assign risk bands
-    def get_risk_band(score):
-        if score < 0.33:
-            return 'low'
-        elif score < 0.67:
-            return 'medium'
-        else:
-            return 'high'
+    # Three decimals is well within the model's precision; rounding in float64 keeps
+    # exported values short (0.397, not 0.39700001)
+    grid_gdf['risk_score'] = np.round(risk_scores.astype(np.float64), 3)
     
-    grid_gdf['risk_band'] = grid_gdf['risk_score'].apply(get_risk_band)
+    # Assign risk bands on the unrounded scores ([0, 0.33) low, [0.33, 0.67) medium, >= 0.67 high)
+    grid_gdf['risk_band'] = pd.cut(
+        risk_scores,
+        bins=[-np.inf, 0.33, 0.67, np.inf],
+        labels=['low', 'medium', 'high'],
+        right=False
+    )
     
     return grid_gdf
 
 
 def save_results(grid_gdf, output_path):
-    """Save computed risk grid to GeoJSON."""
+    """Save computed risk grid to GeoParquet."""
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    grid_gdf.to_file(output_path, driver='GeoJSON')
+    grid_gdf.to_parquet(output_path, compression='zstd')
     print(f"Saved risk grid with {len(grid_gdf)} cells to {output_path}")
     
     # Print summary statistics
@@ -256,13 +237,29 @@ def save_results(grid_gdf, output_path):
     print(grid_gdf['risk_band'].value_counts())
 
 
-def main():
-    """Main computation pipeline."""
+def parse_bbox(value):
+    """Parse a "minx,miny,maxx,maxy" command-line bbox."""
+    try:
+        minx, miny, maxx, maxy = (float(part) for part in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected minx,miny,maxx,maxy, got {value!r}")
+    if minx >= maxx or miny >= maxy:
+        raise argparse.ArgumentTypeError(f"empty bbox {value!r}")
+    return (minx, miny, maxx, maxy)
+
+
+def main(bbox=None):
+    """Main computation pipeline, optionally restricted to a lon/lat bbox.
+    
+    A bbox run is for quick local checks only: population and shelter distance are
+    normalized by the subset's maxima, and buildings outside the bbox are dropped even
+    in cells it only partly covers, so its scores are not comparable to a full run.
+    """
     print("Starting risk computation...")
     
     # Load configuration and data
     weights_config = load_weights()
-    data = load_mock_data()
+    data = load_mock_data(bbox=bbox)
     
     if data['grid'].empty:
         print("Error: No grid data found")
@@ -275,28 +272,51 @@ def main():
         grid_gdf = grid_gdf.set_crs("EPSG:4326")
         print("Set grid CRS to EPSG:4326")
     
+    # Reproject the other layers to the grid CRS once, up front
+    for key in ('buildings', 'hazards'):
+        if not data[key].empty and data[key].crs != grid_gdf.crs:
+            data[key] = data[key].to_crs(grid_gdf.crs)
+    
     # Compute building metrics
     print("Computing building metrics...")
-    grid_gdf = compute_building_metrics(grid_gdf, data['buildings'])
+    building_metrics = compute_building_metrics(grid_gdf, data['buildings'])
     
     # Compute hazard metrics
     print("Computing hazard metrics...")
-    grid_gdf = compute_hazard_metrics(grid_gdf, data['hazards'])
+    hazard_liq_rank = compute_hazard_metrics(grid_gdf, data['hazards'])
     
     # Compute shelter proximity
     print("Computing shelter proximity...")
-    grid_gdf = compute_shelter_proximity(grid_gdf)
+    shelter_distance_m = compute_shelter_proximity(grid_gdf)
+    
+    # Append all per-cell metrics to the grid in one pass
+    grid_gdf = grid_gdf.assign(
+        **building_metrics.to_dict('series'),
+        hazard_liq_rank=hazard_liq_rank,
+        shelter_distance_m=shelter_distance_m
+    )
+    
+    # Missing values (e.g. no pop_density, buildings without levels) count as 0
+    numeric_columns = grid_gdf.select_dtypes('number').columns
+    grid_gdf[numeric_columns] = grid_gdf[numeric_columns].fillna(0)
     
     # Compute final risk scores
     print("Computing risk scores...")
     grid_gdf = compute_risk_scores(grid_gdf, weights_config)
     
     # Save results
-    output_path = Path("data/computed/risk_grid.geojson")
+    output_path = Path("data/computed/risk_grid.parquet")
     save_results(grid_gdf, output_path)
     
     print("Risk computation completed successfully!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--bbox',
+        type=parse_bbox,
+        help="only load features intersecting minx,miny,maxx,maxy (lon/lat)"
+    )
+    args = parser.parse_args()
+    main(bbox=args.bbox)
\ No newline at end of file
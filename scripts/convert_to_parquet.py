@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Convert mock GeoJSON layers to GeoParquet for faster loading.
+The API reads the .parquet files when they are at least as new as the GeoJSON
+and falls back to GeoJSON otherwise. The outputs are generated, not committed.
+"""
+
+import sys
+from pathlib import Path
+
+import geopandas as gpd
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+
+
+LAYERS = ["grid_500m", "buildings", "hazard_liq"]
+
+
+def convert_layer(geojson_path):
+    """Convert a single GeoJSON file to GeoParquet alongside it."""
+    parquet_path = geojson_path.with_suffix(".parquet")
+    gdf = gpd.read_file(geojson_path, engine="pyogrio")
+    gdf.to_parquet(parquet_path)
+    print(f"Converted {len(gdf)} features: {geojson_path} -> {parquet_path}")
+
+
+def main():
+    """Convert all mock layers."""
+    print("Converting mock data to GeoParquet...")
+    
+    for name in LAYERS:
+        geojson_path = settings.mock_dir / f"{name}.geojson"
+        if not geojson_path.exists():
+            print(f"Warning: {geojson_path} not found, skipping")
+            continue
+        convert_layer(geojson_path)
+    
+    print("Conversion completed successfully!")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -3,10 +3,14 @@
 Simple PMTiles range-request server for serving prebuilt vector tiles.
 """
 
+import mmap
 import os
+import re
 import sys
+import threading
+from functools import lru_cache
 from pathlib import Path
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 import mimetypes
 
 # Add parent directory to path
@@ -15,9 +19,41 @@ sys.path.append(str(Path(__file__).parent.parent))
 from app.core.config import settings
 
 
+# Single byte range, e.g. "bytes=0-1023", "bytes=1024-" or "bytes=-512"
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$', re.ASCII)
+
+# Only files under the tiles directory are served (resolved before main() changes directory)
+_TILES_ROOT = settings.tiles_dir.resolve()
+
+# Read-only mappings of served tile files, opened once per resolved path
+_mmaps: dict[Path, mmap.mmap] = {}
+_mmaps_lock = threading.Lock()
+
+
+@lru_cache(maxsize=64)
+def _file_size(path):
+    """Size of a tile file, cached; missing files raise and are not cached."""
+    return path.stat().st_size
+
+
+def _get_mmap(path):
+    """Return a shared read-only mapping of a resolved path, mapping it on first use."""
+    with _mmaps_lock:
+        if path not in _mmaps:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                _mmaps[path] = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)  # The mapping stays valid after the descriptor is closed
+        return _mmaps[path]
+
+
 class PMTilesHandler(SimpleHTTPRequestHandler):
     """Custom handler for PMTiles with proper CORS and range request support."""
     
+    # Keep-alive lets map clients reuse one connection for many range reads
+    protocol_version = "HTTP/1.1"
+    
     def end_headers(self):
         """Add CORS headers."""
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -27,7 +63,7 @@ class PMTilesHandler(SimpleHTTPRequestHandler):
     
     def do_OPTIONS(self):
         """Handle CORS preflight requests."""
-        self.send_response(200)
+        self.send_response(204)  # No body by definition, so keep-alive clients don't wait for one
         self.end_headers()
     
     def do_GET(self):
@@ -41,43 +77,51 @@ class PMTilesHandler(SimpleHTTPRequestHandler):
         """Serve PMTiles files with proper range request support."""
         # Remove query parameters and leading slash
         file_path = self.path.split('?')[0].lstrip('/')
-        full_path = Path(file_path)
         
-        if not full_path.exists():
-            self.send_error(404, f"File not found: {file_path}")
+        # Resolve so every spelling of a file shares one cache entry, and stay inside the tiles directory
+        full_path = Path(file_path).resolve()
+        if not full_path.is_relative_to(_TILES_ROOT):
+            self.send_error(403, "Forbidden")
             return
         
-        file_size = full_path.stat().st_size
+        try:
+            file_size = _file_size(full_path)
+        except FileNotFoundError:
+            self.send_error(404, f"File not found: {file_path}")
+            return
         
         # Handle range requests
         range_header = self.headers.get('Range')
-        if range_header:
-            # Parse range header (e.g., "bytes=0-1023")
-            try:
-                ranges = range_header.replace('bytes=', '').split('-')
-                start = int(ranges[0]) if ranges[0] else 0
-                end = int(ranges[1]) if ranges[1] else file_size - 1
-                
-                # Ensure valid range
-                start = max(0, min(start, file_size - 1))
-                end = max(start, min(end, file_size - 1))
-                content_length = end - start + 1
-                
-                # Send partial content response
-                self.send_response(206)
-                self.send_header('Content-Type', 'application/octet-stream')
-                self.send_header('Content-Length', str(content_length))
-                self.send_header('Content-Range', f'bytes {start}-{end}/{file_size}')
-                self.send_header('Accept-Ranges', 'bytes')
-                self.end_headers()
-                
-                # Send file data
-                with open(full_path, 'rb') as f:
-                    f.seek(start)
-                    self.wfile.write(f.read(content_length))
-                
-            except (ValueError, IndexError):
+        if range_header and file_size:
+            # Parse a single range (e.g., "bytes=0-1023"); multi-range and malformed headers are rejected
+            match = _RANGE_RE.match(range_header)
+            if not match or not (match.group(1) or match.group(2)):
                 self.send_error(400, "Invalid range header")
+                return
+            
+            if match.group(1):
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else file_size - 1
+            else:
+                # Suffix range ("bytes=-500"): the last N bytes
+                start = file_size - int(match.group(2))
+                end = file_size - 1
+            
+            # Ensure valid range
+            start = max(0, min(start, file_size - 1))
+            end = max(start, min(end, file_size - 1))
+            content_length = end - start + 1
+            
+            # Send partial content response
+            self.send_response(206)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(content_length))
+            self.send_header('Content-Range', f'bytes {start}-{end}/{file_size}')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+            
+            # Send file data straight from the page cache
+            self.wfile.write(memoryview(_get_mmap(full_path))[start:end + 1])
         else:
             # Send full file
             self.send_response(200)
@@ -86,8 +130,9 @@ class PMTilesHandler(SimpleHTTPRequestHandler):
             self.send_header('Accept-Ranges', 'bytes')
             self.end_headers()
             
-            with open(full_path, 'rb') as f:
-                self.wfile.write(f.read())
+            # Empty files cannot be mapped and have no body to send
+            if file_size:
+                self.wfile.write(memoryview(_get_mmap(full_path)))
 
 
 def main():
@@ -102,7 +147,7 @@ def main():
     
     os.chdir(tiles_dir.parent)
     
-    server = HTTPServer(('localhost', port), PMTilesHandler)
+    server = ThreadingHTTPServer(('localhost', port), PMTilesHandler)
     print(f"Starting PMTiles server on http://localhost:{port}")
     print(f"Serving files from: {tiles_dir.parent}")
     print("Press Ctrl+C to stop the server")
@@ -2,9 +2,12 @@
 Test risk engine functionality.
 """
 
+import json
+from collections.abc import Mapping
+
 import pytest
 import numpy as np
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
 from app.services.risk_engine import RiskEngine
 
@@ -18,13 +21,17 @@ class TestRiskEngine:
     
     def test_load_weights_default(self):
         """Test loading default weights when config file doesn't exist."""
-        with patch('pathlib.Path.exists', return_value=False):
+        with patch('pathlib.Path.read_bytes', side_effect=FileNotFoundError):
             engine = RiskEngine()
             weights = engine.weights
             
             assert "weights" in weights
-            assert isinstance(weights["weights"], dict)
+            assert isinstance(weights["weights"], Mapping)
             assert "population_density" in weights["weights"]
+            
+            # The shared default must not be mutable through an engine
+            with pytest.raises(TypeError):
+                weights["weights"]["population_density"] = 1.0
     
     def test_load_weights_from_file(self):
         """Test loading weights from config file."""
@@ -40,10 +47,7 @@ class TestRiskEngine:
             }
         }
         
-        with patch('pathlib.Path.exists', return_value=True), \
-             patch('builtins.open'), \
-             patch('json.load', return_value=mock_weights):
-            
+        with patch('pathlib.Path.read_bytes', return_value=json.dumps(mock_weights).encode()):
             engine = RiskEngine()
             assert engine.weights == mock_weights
     
@@ -55,71 +59,173 @@ class TestRiskEngine:
         assert self.engine._get_risk_band(0.8) == "high"
         assert self.engine._get_risk_band(1.0) == "high"
     
-    @pytest.mark.asyncio
-    async def test_calculate_risk_score_mock_location(self):
+    def test_calculate_risk_score_mock_location(self):
         """Test risk score calculation for a mock location."""
-        # Mock the data loading
-        with patch.object(self.engine, '_load_data'):
-            # Set up mock data
-            self.engine._grid_data = MagicMock()
-            self.engine._grid_data.empty = False
-            self.engine._buildings_data = MagicMock()
-            self.engine._buildings_data.empty = False
-            self.engine._hazard_data = MagicMock()
-            self.engine._hazard_data.empty = False
+        # Set up mock data
+        self.engine._grid_pop = np.array([10000], dtype=np.float32)
+        self.engine._is_residential = np.ones(5, dtype=np.bool_)
+        self.engine._building_levels = np.full(5, 8, dtype=np.float32)
+        self.engine._hazard_liq = np.array([3], dtype=np.int32)
+        
+        # Mock the helper methods
+        with patch.object(self.engine, '_find_containing_cell') as mock_find_cell, \
+             patch.object(self.engine, '_get_nearby_buildings') as mock_nearby:
+            
+            # Set up mock returns
+            mock_find_cell.side_effect = [
+                0,  # grid cell
+                0   # hazard cell
+            ]
+            mock_nearby.return_value = np.arange(5)
             
-            # Mock the helper methods
-            with patch.object(self.engine, '_find_containing_cell') as mock_find_cell, \
-                 patch.object(self.engine, '_get_nearby_buildings') as mock_nearby:
-                
-                # Set up mock returns
-                mock_find_cell.side_effect = [
-                    {"pop_density": 10000},  # grid cell
-                    {"liq_rank": 3}          # hazard cell
-                ]
-                
-                mock_buildings = MagicMock()
-                mock_buildings.__len__.return_value = 5
-                mock_buildings.__getitem__.return_value = mock_buildings
-                mock_buildings.get.side_effect = lambda key, default=None: {
-                    "use": "residential",
-                    "levels": 8
-                }.get(key, default)
-                mock_buildings.mean.return_value = 8.0
-                mock_nearby.return_value = mock_buildings
-                
-                # Calculate risk score
-                result = await self.engine.calculate_risk_score(35.6598, 139.7006)
-                
-                # Verify result structure
-                assert hasattr(result, 'risk_score')
-                assert hasattr(result, 'band')
-                assert hasattr(result, 'top_contributors')
-                assert hasattr(result, 'lat')
-                assert hasattr(result, 'lon')
-                
-                assert 0 <= result.risk_score <= 1
-                assert result.band in ["low", "medium", "high"]
-                assert isinstance(result.top_contributors, list)
+            # Calculate risk score
+            result = self.engine.calculate_risk_score(35.6598, 139.7006)
+            
+            # Verify result structure
+            assert hasattr(result, 'risk_score')
+            assert hasattr(result, 'band')
+            assert hasattr(result, 'top_contributors')
+            assert hasattr(result, 'lat')
+            assert hasattr(result, 'lon')
+            
+            assert 0 <= result.risk_score <= 1
+            assert result.band in ["low", "medium", "high"]
+            assert isinstance(result.top_contributors, list)
+            
+            factors = {c["factor"]: c for c in result.top_contributors}
+            assert factors["residential_unit_count"]["description"] == "Residential buildings: 5"
+            assert factors["hazard_liquefaction_rank"]["value"] == 0.6
+    
+    def test_load_mock_data(self):
+        """Test that load() populates the data layers from mock files."""
+        engine = RiskEngine()
+        assert len(engine._grid_pop) == 0
+        
+        engine.load()
+        
+        assert len(engine._grid_pop) == len(engine._grid_geom) > 0
+        assert len(engine._is_residential) == len(engine._buildings_geom) > 0
+        assert engine._is_residential.dtype == np.bool_
+        assert not np.isnan(engine._building_levels).any()
+        assert len(engine._hazard_liq) == len(engine._hazard_geom) > 0
+    
+    def test_read_layer_ignores_stale_parquet(self, tmp_path):
+        """Test that a GeoJSON layer newer than its GeoParquet copy is read instead."""
+        import os
+        import geopandas as gpd
+        from shapely.geometry import Point
+        
+        geojson_path = tmp_path / "layer.geojson"
+        parquet_path = tmp_path / "layer.parquet"
+        gpd.GeoDataFrame({"liq_rank": [5]}, geometry=[Point(0, 0)], crs="EPSG:4326").to_file(geojson_path)
+        gpd.GeoDataFrame({"liq_rank": [1]}, geometry=[Point(0, 0)], crs="EPSG:4326").to_parquet(parquet_path)
+        
+        os.utime(geojson_path, (1, 1))
+        assert self.engine._read_layer(geojson_path, ["liq_rank"])["liq_rank"].tolist() == [1]
+        
+        os.utime(parquet_path, (0, 0))
+        assert self.engine._read_layer(geojson_path, ["liq_rank"])["liq_rank"].tolist() == [5]
+    
+    def test_calculate_risk_score_cached_by_quantized_location(self):
+        """Test that nearby queries reuse the cached score computation."""
+        self.engine.load()
+        
+        first = self.engine.calculate_risk_score(35.65981, 139.70061)
+        second = self.engine.calculate_risk_score(35.65979, 139.70059)
+        
+        assert self.engine._score_core.cache_info().hits == 1
+        assert first.risk_score == second.risk_score
+        assert second.lat == 35.65979
+        assert second.lon == 139.70059
+    
+    def test_calculate_risk_score_just_inside_cell_edge(self):
+        """Test that quantization never moves a query onto a grid or hazard edge."""
+        self.engine.load()
+        
+        # 0.0004 degrees east of the grid_001/grid_002 edge at lon 139.705
+        result = self.engine.calculate_risk_score(35.6604, 139.7054)
+        descriptions = [c["description"] for c in result.top_contributors]
+        assert "Population density: 12000/km²" in descriptions
+        
+        # Just inside hazard liq_001, whose edge is at lat 35.67
+        result = self.engine.calculate_risk_score(35.6696, 139.7000)
+        factors = [c["factor"] for c in result.top_contributors]
+        assert "hazard_liquefaction_rank" in factors
+        assert result.risk_score > 0
+    
+    def test_calculate_risk_score_outside_data_bbox(self):
+        """Test that locations outside all loaded layers return early."""
+        self.engine.load()
+        
+        result = self.engine.calculate_risk_score(34.0, 135.0)
+        
+        assert result.risk_score == 0.0
+        assert result.band == "low"
+        assert result.top_contributors == []
+        assert self.engine._score_core.cache_info().misses == 0
     
     def test_find_containing_cell_empty_data(self):
         """Test finding containing cell with empty data."""
         from shapely.geometry import Point
-        import geopandas as gpd
         
         point = Point(139.7006, 35.6598)
-        empty_gdf = gpd.GeoDataFrame()
         
-        result = self.engine._find_containing_cell(point, empty_gdf)
+        result = self.engine._find_containing_cell(point, self.engine._grid_tree)
         assert result is None
     
     def test_get_nearby_buildings_empty_data(self):
         """Test getting nearby buildings with empty data."""
+        result = self.engine._get_nearby_buildings(139.7006, 35.6598, 100)
+        assert len(result) == 0
+    
+    def test_spatial_lookups_use_loaded_trees(self):
+        """Test STRtree-backed lookups against the mock data."""
         from shapely.geometry import Point
-        import geopandas as gpd
         
+        self.engine.load()
         point = Point(139.7006, 35.6598)
-        empty_gdf = gpd.GeoDataFrame()
         
-        result = self.engine._get_nearby_buildings(point, empty_gdf, 100)
-        assert len(result) == 0
\ No newline at end of file
+        cell = self.engine._find_containing_cell(point, self.engine._grid_tree)
+        assert cell is not None
+        assert self.engine._grid_pop[cell] == 8500
+        
+        nearby = self.engine._get_nearby_buildings(139.7006, 35.6598, 100)
+        assert len(nearby) > 0
+        
+        # Radius is in meters: nothing lies within 1m of a point in open ground
+        assert len(self.engine._get_nearby_buildings(139.6000, 35.6000, 1)) == 0
+    
+    def test_find_grid_cell_rectangular_fast_path(self):
+        """Test that the bounds-based grid lookup matches the STRtree lookup."""
+        from shapely.geometry import Point
+        
+        self.engine.load()
+        assert self.engine._grid_bounds is not None
+        
+        for lon, lat in [(139.7006, 35.6598), (139.7100, 35.6600), (139.6000, 35.6000)]:
+            assert self.engine._find_grid_cell(lon, lat) == self.engine._find_containing_cell(
+                Point(lon, lat), self.engine._grid_tree
+            )
+        
+        # Shared edges belong to the cell on their max side; outer max edges to none
+        assert self.engine._find_grid_cell(139.705, 35.66) == 1
+        assert self.engine._find_grid_cell(139.70, 35.655) == 0
+        assert self.engine._find_grid_cell(139.715, 35.66) is None
+        assert self.engine._find_grid_cell(139.70, 35.665) is None
+    
+    def test_max_intersecting_rank_bulk_query(self):
+        """Test per-geometry max hazard rank against a brute-force intersection."""
+        import shapely
+        from app.services._spatial import max_intersecting_rank
+        
+        empty = max_intersecting_rank(None, self.engine._hazard_liq, np.array([shapely.box(0, 0, 1, 1)]))
+        assert (empty == 1).all()
+        
+        self.engine.load()
+        ranks = max_intersecting_rank(
+            self.engine._hazard_tree, self.engine._hazard_liq, self.engine._grid_geom
+        )
+        
+        for geom, rank in zip(self.engine._grid_geom, ranks):
+            hits = self.engine._hazard_liq[shapely.intersects(self.engine._hazard_geom, geom)]
+            assert rank == (hits.max() if len(hits) else 1)
\ No newline at end of file
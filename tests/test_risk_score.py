@@ -6,13 +6,18 @@ import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 
-client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def client():
+    """Test client with application lifespan (data preload) applied."""
+    with TestClient(app) as client:
+        yield client
 
 
 class TestRiskScore:
     """Test risk scoring endpoint."""
     
-    def test_risk_score_endpoint_valid_coordinates(self):
+    def test_risk_score_endpoint_valid_coordinates(self, client):
         """Test risk score endpoint with valid Tokyo coordinates."""
         # Test with Shibuya coordinates
         lat, lon = 35.6598, 139.7006
@@ -39,7 +44,7 @@ class TestRiskScore:
         assert data["lat"] == lat
         assert data["lon"] == lon
     
-    def test_risk_score_invalid_latitude(self):
+    def test_risk_score_invalid_latitude(self, client):
         """Test risk score endpoint with invalid latitude."""
         response = client.get("/risk/score?lat=91&lon=139.7006")
         assert response.status_code == 400
@@ -47,7 +52,7 @@ class TestRiskScore:
         response = client.get("/risk/score?lat=-91&lon=139.7006")
         assert response.status_code == 400
     
-    def test_risk_score_invalid_longitude(self):
+    def test_risk_score_invalid_longitude(self, client):
         """Test risk score endpoint with invalid longitude."""
         response = client.get("/risk/score?lat=35.6598&lon=181")
         assert response.status_code == 400
@@ -55,7 +60,7 @@ class TestRiskScore:
         response = client.get("/risk/score?lat=35.6598&lon=-181")
         assert response.status_code == 400
     
-    def test_risk_score_missing_parameters(self):
+    def test_risk_score_missing_parameters(self, client):
         """Test risk score endpoint with missing parameters."""
         # Missing latitude
         response = client.get("/risk/score?lon=139.7006")
@@ -69,7 +74,7 @@ class TestRiskScore:
         response = client.get("/risk/score")
         assert response.status_code == 422
     
-    def test_risk_score_contributors_structure(self):
+    def test_risk_score_contributors_structure(self, client):
         """Test that risk contributors have expected structure."""
         lat, lon = 35.6598, 139.7006
         response = client.get(f"/risk/score?lat={lat}&lon={lon}")
@@ -91,7 +96,18 @@ class TestRiskScore:
                 assert isinstance(contributor["value"], (int, float))
                 assert isinstance(contributor["description"], str)
     
-    def test_multiple_locations(self):
+    def test_risk_score_response_compressed(self, client):
+        """Test that risk score responses are gzip-compressed when accepted."""
+        response = client.get(
+            "/risk/score?lat=35.6598&lon=139.7006",
+            headers={"Accept-Encoding": "gzip"}
+        )
+        
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert 0 <= response.json()["risk_score"] <= 1
+    
+    def test_multiple_locations(self, client):
         """Test risk scores for multiple Tokyo locations."""
         test_locations = [
             (35.6762, 139.6993),  # Shibuya
@@ -112,7 +128,7 @@ class TestRiskScore:
 class TestShelters:
     """Test shelter finding functionality."""
     
-    def test_nearby_shelters_endpoint(self):
+    def test_nearby_shelters_endpoint(self, client):
         """Test nearby shelters endpoint."""
         lat, lon = 35.6598, 139.7006
         response = client.get(f"/shelters/nearby?lat={lat}&lon={lon}")
@@ -135,7 +151,7 @@ class TestShelters:
             for field in expected_shelter_fields:
                 assert field in shelter
     
-    def test_shelters_with_custom_limit(self):
+    def test_shelters_with_custom_limit(self, client):
         """Test shelters endpoint with custom limit."""
         lat, lon = 35.6598, 139.7006
         response = client.get(f"/shelters/nearby?lat={lat}&lon={lon}&limit=5")
@@ -144,7 +160,7 @@ class TestShelters:
         data = response.json()
         assert len(data["shelters"]) <= 5
     
-    def test_shelters_sorted_by_distance(self):
+    def test_shelters_sorted_by_distance(self, client):
         """Test that shelters are sorted by distance."""
         lat, lon = 35.6598, 139.7006
         response = client.get(f"/shelters/nearby?lat={lat}&lon={lon}")
@@ -156,4 +172,23 @@ class TestShelters:
         if len(shelters) > 1:
             # Check that distances are in ascending order
             distances = [shelter["distance_km"] for shelter in shelters]
-            assert distances == sorted(distances)
\ No newline at end of file
+            assert distances == sorted(distances)
+    
+    def test_shelters_limit_exceeds_available(self, client):
+        """Test that a limit above the shelter count returns all shelters in order."""
+        lat, lon = 35.6598, 139.7006
+        response = client.get(f"/shelters/nearby?lat={lat}&lon={lon}&limit=10")
+        
+        assert response.status_code == 200
+        distances = [shelter["distance_km"] for shelter in response.json()["shelters"]]
+        assert len(distances) > 0
+        assert distances == sorted(distances)
+    
+    def test_missing_shelter_data_fails_loudly(self, tmp_path):
+        """Test that a missing shelter archive raises instead of serving no shelters."""
+        from unittest.mock import patch
+        from app.services.shelter_service import ShelterService
+        
+        with patch("app.services.shelter_service.SHELTERS_PATH", tmp_path / "shelters.npz"):
+            with pytest.raises(FileNotFoundError, match="build_shelters_npz"):
+                ShelterService()
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""
+Test tile endpoint caching behaviour.
+"""
+
+import gzip
+import os
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from pmtiles.tile import Compression, TileType, zxy_to_tileid
+from pmtiles.writer import write
+
+from app.main import app
+from app.services.tiler import TileService
+
+client = TestClient(app)
+
+# Gzip-compressed tile body, larger than GZipMiddleware's minimum_size
+TILE_DATA = gzip.compress(os.urandom(600))
+
+
+def write_archive(path, tiles):
+    """Write a PMTiles archive holding the given {(z, x, y): data} tiles."""
+    with write(path) as writer:
+        for tile_id, data in sorted((zxy_to_tileid(*zxy), data) for zxy, data in tiles.items()):
+            writer.write_tile(tile_id, data)
+        writer.finalize({
+            "tile_type": TileType.MVT,
+            "tile_compression": Compression.GZIP,
+            "min_zoom": 12, "max_zoom": 12,
+            "min_lon_e7": 1396900000, "min_lat_e7": 356500000,
+            "max_lon_e7": 1397600000, "max_lat_e7": 357000000,
+            "center_zoom": 12, "center_lon_e7": 1397000000, "center_lat_e7": 356600000
+        }, {})
+
+
+@pytest.fixture
+def archive_service(tmp_path):
+    """Tile service backed by a real one-tile PMTiles archive (tile 12/3638/1612)."""
+    archive_path = tmp_path / "risk.pmtiles"
+    write_archive(archive_path, {(12, 3638, 1612): TILE_DATA})
+    
+    service = TileService(archive_path)
+    with patch("app.api.tiles.tile_service", service):
+        yield service
+
+
+class TestTileCaching:
+    """Test HTTP caching headers on tile endpoints."""
+    
+    def test_tile_has_cache_headers(self, archive_service):
+        """Test that archive tiles are served with immutable caching and an ETag."""
+        response = client.get("/tiles/12/3638/1612.pbf")
+        
+        assert response.status_code == 200
+        assert "immutable" in response.headers["cache-control"]
+        assert response.headers["etag"].startswith('"12-3638-1612-')
+    
+    def test_tile_not_compressed_twice(self, archive_service):
+        """Test that gzip tiles above the middleware threshold pass through unchanged."""
+        assert len(TILE_DATA) > 256
+        
+        with client.stream(
+            "GET", "/tiles/12/3638/1612.pbf", headers={"Accept-Encoding": "gzip"}
+        ) as response:
+            raw = b"".join(response.iter_raw())
+        
+        assert response.headers["content-encoding"] == "gzip"
+        assert raw == TILE_DATA
+    
+    def test_missing_tile_is_not_cacheable(self, archive_service):
+        """Test that tiles absent from the archive are empty and must be revalidated."""
+        response = client.get("/tiles/12/3638/1613.pbf")
+        
+        assert response.status_code == 204
+        assert response.content == b""
+        assert response.headers["cache-control"] == "no-cache"
+        assert "etag" in response.headers
+    
+    def test_no_archive_is_not_cacheable(self):
+        """Test that the empty placeholder archive never yields immutable responses."""
+        response = client.get("/tiles/12/3638/1612.pbf")
+        
+        assert response.status_code == 204
+        assert response.headers["cache-control"] == "no-cache"
+    
+    def test_rebuilt_archive_is_picked_up(self, archive_service):
+        """Test that rewriting the archive changes ETags and serves the new tiles."""
+        etag = client.get("/tiles/12/3638/1613.pbf").headers["etag"]
+        
+        write_archive(archive_service.tiles_path, {
+            (12, 3638, 1612): TILE_DATA, (12, 3638, 1613): TILE_DATA
+        })
+        os.utime(archive_service.tiles_path, ns=(0, archive_service._mtime_ns + 10**9))
+        
+        response = client.get("/tiles/12/3638/1613.pbf", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert "immutable" in response.headers["cache-control"]
+    
+    def test_tile_not_modified(self, archive_service):
+        """Test that a matching If-None-Match returns 304 without a body."""
+        etag = client.get("/tiles/12/3638/1612.pbf").headers["etag"]
+        
+        response = client.get("/tiles/12/3638/1612.pbf", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+    
+    def test_tile_etag_differs_per_tile(self, archive_service):
+        """Test that different tiles have different ETags."""
+        etag = client.get("/tiles/12/3638/1612.pbf").headers["etag"]
+        
+        response = client.get("/tiles/12/3638/1613.pbf", headers={"If-None-Match": etag})
+        assert response.status_code == 204
+        assert response.headers["etag"] != etag
+    
+    def test_risk_heatmap_tile_not_modified(self, archive_service):
+        """Test conditional requests on the risk heatmap tile endpoint."""
+        response = client.get("/risk/heatmap/tiles/12/3638/1612.pbf")
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        
+        response = client.get(
+            "/risk/heatmap/tiles/12/3638/1612.pbf", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+    
+    def test_archive_tile_served_on_both_endpoints(self, archive_service):
+        """Test that real archive tiles are returned as raw bytes by both tile endpoints."""
+        for url in ["/tiles/12/3638/1612.pbf", "/risk/heatmap/tiles/12/3638/1612.pbf"]:
+            response = client.get(url, headers={"Accept-Encoding": "identity"})
+            
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "application/x-protobuf"
+            assert response.headers["content-encoding"] == "gzip"
+            assert "immutable" in response.headers["cache-control"]
\ No newline at end of file